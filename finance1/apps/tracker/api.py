@@ -0,0 +1,139 @@
+"""
+REST endpoints for bulk budget management.
+
+Mount with ``path('api/', include('finance.api'))`` in the root URLconf.
+
+- ``POST budgets/bulk/`` upserts a list of ``{category_name, amount, currency}``
+  items in a single INSERT ... ON CONFLICT statement.
+- ``POST budgets/copy/`` copies every budget in ``source_currency`` into
+  ``target_currency`` scaled by ``percent`` (100 = same amount), entirely in SQL.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.urls import path
+from django.utils import timezone
+from rest_framework import permissions, serializers, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .models import Budget, Category
+
+
+class BudgetItemSerializer(serializers.Serializer):
+    category_name = serializers.CharField(max_length=100)
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0'))
+    currency = serializers.CharField(max_length=8, default='USD')
+
+
+class BudgetCopySerializer(serializers.Serializer):
+    source_currency = serializers.CharField(max_length=8)
+    target_currency = serializers.CharField(max_length=8, required=False)
+    percent = serializers.DecimalField(max_digits=7, decimal_places=2, min_value=Decimal('0'),
+                                       max_value=Decimal('10000'), default=Decimal('100'))
+
+
+# Largest value Budget.amount (max_digits=12, decimal_places=2) can hold.
+MAX_BUDGET_AMOUNT = Decimal('9999999999.99')
+
+
+def budgetable_categories(owner):
+    return Category.objects.filter(owner=owner, type='expense', is_active=True)
+
+
+def resolve_categories(owner, names):
+    """Map names to the owner's active expense categories, creating missing ones.
+
+    Names that only match an income or inactive category are rejected rather
+    than duplicated.
+    """
+    found = {}
+    expense_categories = budgetable_categories(owner)
+    for category in expense_categories.filter(name__in=names).order_by('pk'):
+        found.setdefault(category.name, category)
+    missing = [name for name in names if name not in found]
+    clashing = sorted(set(Category.objects.filter(owner=owner, name__in=missing).values_list('name', flat=True)))
+    if clashing:
+        raise serializers.ValidationError(
+            {'category_name': [f"'{name}' is an income or inactive category and cannot have a budget." for name in clashing]}
+        )
+    if missing:
+        created = Category.objects.bulk_create([Category(owner=owner, name=name, type='expense') for name in missing])
+        if created and created[0].pk is None:
+            # Backends without RETURNING on bulk inserts: reload to get the primary keys.
+            created = expense_categories.filter(name__in=missing).order_by('pk')
+        for category in created:
+            found.setdefault(category.name, category)
+    return found
+
+
+def bulk_upsert_budgets(owner, items):
+    """Insert or update many budgets for ``owner`` in one statement; returns the number of items written."""
+    # Later items win; Postgres refuses to update the same row twice in one ON CONFLICT statement.
+    latest = {(item['category_name'], item['currency']): item['amount'] for item in items}
+    if not latest:
+        return 0
+    with transaction.atomic():
+        categories = resolve_categories(owner, sorted({name for name, _ in latest}))
+        Budget.objects.bulk_create(
+            [Budget(owner=owner, category=categories[name], currency=currency, amount=amount)
+             for (name, currency), amount in latest.items()],
+            update_conflicts=True,
+            unique_fields=['owner', 'category', 'currency'],
+            update_fields=['amount', 'updated_at'],
+        )
+    return len(latest)
+
+
+def copy_budgets(owner, source_currency, target_currency=None, percent=Decimal('100')):
+    """Copy the owner's budgets to another currency (or rescale in place) with one INSERT ... SELECT.
+
+    Only budgets on active expense categories are copied.
+    """
+    target_currency = target_currency or source_currency
+    expense_categories = budgetable_categories(owner).values('pk')
+    largest = (Budget.objects.filter(owner=owner, currency=source_currency, category__in=expense_categories)
+               .aggregate(m=Max('amount'))['m'])
+    if largest is not None and largest * percent / 100 > MAX_BUDGET_AMOUNT:
+        raise serializers.ValidationError({'percent': ['Scaled budgets would exceed the maximum budget amount.']})
+    category_sql, category_params = expense_categories.query.sql_with_params()
+    table = connection.ops.quote_name(Budget._meta.db_table)
+    col = {f.name: connection.ops.quote_name(f.column) for f in Budget._meta.concrete_fields}
+    sql = (
+        f"INSERT INTO {table} ({col['owner']}, {col['category']}, {col['amount']}, {col['currency']}, {col['updated_at']}) "
+        f"SELECT {col['owner']}, {col['category']}, ROUND({col['amount']} * %s / 100.0, 2), %s, %s "
+        f"FROM {table} WHERE {col['owner']} = %s AND {col['currency']} = %s AND {col['category']} IN ({category_sql}) "
+        f"ON CONFLICT ({col['owner']}, {col['category']}, {col['currency']}) "
+        f"DO UPDATE SET {col['amount']} = excluded.{col['amount']}, {col['updated_at']} = excluded.{col['updated_at']}"
+    )
+    with connection.cursor() as cursor:
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        cursor.execute(sql, [percent, target_currency, now, owner.pk, source_currency, *category_params])
+        return cursor.rowcount
+
+
+class BudgetBulkView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = BudgetItemSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        written = bulk_upsert_budgets(request.user, serializer.validated_data)
+        return Response({'written': written}, status=status.HTTP_200_OK)
+
+
+class BudgetCopyView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = BudgetCopySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        written = copy_budgets(request.user, **serializer.validated_data)
+        return Response({'written': written}, status=status.HTTP_200_OK)
+
+
+urlpatterns = [
+    path('budgets/bulk/', BudgetBulkView.as_view(), name='budgets_bulk'),
+    path('budgets/copy/', BudgetCopyView.as_view(), name='budgets_copy'),
+]
@@ -0,0 +1,174 @@
+"""
+Batch-job framework for nightly multi-user management commands.
+
+A job subclasses ``BatchJob`` and implements ``process_user``. Users are split
+into shards of ``chunk_size`` consecutive primary keys and processed across a
+``ProcessPoolExecutor``; each worker process opens its own database connection.
+Every finished shard is recorded in ``BatchJobCheckpoint`` under the run key
+(today's date by default), so re-running an interrupted command skips the
+shards that already completed. A shard that fails part-way is retried as a
+whole, so ``process_user`` must be safe to run twice for the same user.
+
+A management command only needs to point at the job::
+
+    class Command(BatchJobCommand):
+        help = '...'
+        job_class = MyJob
+"""
+import bisect
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import BatchJobCheckpoint
+
+
+class BatchJob:
+    name = None
+
+    def get_users(self):
+        return get_user_model().objects.filter(is_active=True)
+
+    def process_user(self, user):
+        raise NotImplementedError
+
+
+def plan_shards(job, run_key, chunk_size):
+    """Return lists of user ids still to process, skipping ranges checkpointed for this run."""
+    checkpoints = sorted(
+        BatchJobCheckpoint.objects.filter(job=job.name, run_key=run_key).values_list('first_user_id', 'last_user_id')
+    )
+    # Merge overlapping ranges: retries with a different chunk size produce
+    # checkpoints that nest inside or straddle earlier ones.
+    done = []
+    for first, last in checkpoints:
+        if done and first <= done[-1][1] + 1:
+            done[-1][1] = max(done[-1][1], last)
+        else:
+            done.append([first, last])
+    starts = [first for first, _ in done]
+    pending = []
+    for pk in job.get_users().order_by('pk').values_list('pk', flat=True):
+        i = bisect.bisect_right(starts, pk) - 1
+        if i >= 0 and pk <= done[i][1]:
+            continue
+        pending.append(pk)
+    return [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+
+
+def _init_worker():
+    # Spawned workers start without Django configured; forked ones inherit it.
+    if not apps.ready:
+        django.setup()
+
+
+def _run_shard(job_path, user_ids):
+    job = import_string(job_path)()
+    started = time.monotonic()
+    count = 0
+    for user in job.get_users().filter(pk__in=user_ids).order_by('pk'):
+        job.process_user(user)
+        count += 1
+    return {
+        'first_user_id': user_ids[0],
+        'last_user_id': user_ids[-1],
+        'user_count': count,
+        'duration': time.monotonic() - started,
+    }
+
+
+def run_batch_job(job_class, run_key, chunk_size=100, workers=None, on_shard=None, mp_context=None):
+    """Run ``job_class`` over all pending shards; returns ``(results, errors)``.
+
+    ``on_shard(result)`` is called in the parent as each shard completes, after
+    its checkpoint is saved. With ``workers=1`` shards run in this process.
+    ``mp_context`` is passed through to ``ProcessPoolExecutor``.
+    """
+    if not job_class.name:
+        raise ValueError(f"{job_class.__qualname__} must set a name to checkpoint its shards.")
+    job = job_class()
+    job_path = f"{job_class.__module__}.{job_class.__qualname__}"
+    shards = plan_shards(job, run_key, chunk_size)
+    results, errors = [], []
+
+    def record(result):
+        BatchJobCheckpoint.objects.create(job=job.name, run_key=run_key, **result)
+        results.append(result)
+        if on_shard:
+            on_shard(result)
+
+    if workers == 1:
+        for user_ids in shards:
+            try:
+                record(_run_shard(job_path, user_ids))
+            except Exception as exc:
+                errors.append((user_ids[0], user_ids[-1], exc))
+        return results, errors
+
+    # Children must not share the parent's database socket: close it before
+    # forking so every worker connects on its own first query.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=_init_worker) as pool:
+        futures = {pool.submit(_run_shard, job_path, user_ids): user_ids for user_ids in shards}
+        for future in as_completed(futures):
+            user_ids = futures[future]
+            try:
+                record(future.result())
+            except Exception as exc:
+                errors.append((user_ids[0], user_ids[-1], exc))
+    return results, errors
+
+
+class BatchJobCommand(BaseCommand):
+    job_class = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of worker processes (1 runs in-process). Defaults to the CPU '
+                                 'count, or 1 on SQLite where concurrent writers contend for one lock.')
+        parser.add_argument('--chunk-size', type=int, default=100, help='Users per shard.')
+        parser.add_argument('--run-key', default=None,
+                            help="Checkpoint key for this run; defaults to today's date.")
+        parser.add_argument('--restart', action='store_true',
+                            help='Discard checkpoints for this run key and start over.')
+
+    def handle(self, *args, **options):
+        if not self.job_class or not self.job_class.name:
+            raise CommandError(f"{type(self).__module__} must set job_class to a BatchJob with a name.")
+        if options['workers'] is None:
+            options['workers'] = 1 if connection.vendor == 'sqlite' else (os.cpu_count() or 1)
+        for option in ('workers', 'chunk_size'):
+            if options[option] < 1:
+                raise CommandError(f"--{option.replace('_', '-')} must be at least 1.")
+        job_name = self.job_class.name
+        run_key = options['run_key'] or timezone.localdate().isoformat()
+        if options['restart']:
+            BatchJobCheckpoint.objects.filter(job=job_name, run_key=run_key).delete()
+
+        def report(result):
+            self.stdout.write(
+                f"shard users {result['first_user_id']}-{result['last_user_id']}: "
+                f"{result['user_count']} users in {result['duration']:.2f}s"
+            )
+
+        started = time.monotonic()
+        results, errors = run_batch_job(
+            self.job_class, run_key,
+            chunk_size=options['chunk_size'], workers=options['workers'], on_shard=report,
+        )
+        for first, last, exc in errors:
+            self.stderr.write(f"shard users {first}-{last} failed: {exc!r}")
+        self.stdout.write(
+            f"{job_name} [{run_key}]: {len(results)} shards, "
+            f"{sum(r['user_count'] for r in results)} users in {time.monotonic() - started:.2f}s"
+        )
+        if errors:
+            raise CommandError(f"{len(errors)} shard(s) failed; re-run with --run-key {run_key} to resume.")
@@ -0,0 +1,80 @@
+"""
+Conditional GET support for the per-user HTML pages (budgets, reports, profile).
+
+The ETag is derived from the user's own data: the latest ``updated_at`` across
+Profile/Category/Budget/Transaction plus the row counts (so deletions, which
+leave no timestamp behind, still change it), salted with ``RELEASE_VERSION`` so
+a deploy invalidates pages rendered by older code. When the browser's ETag
+matches, Django's ``condition`` decorator answers 304 before the view runs, so
+no aggregates are computed and no template is rendered. No ``Last-Modified`` is
+sent: a timestamp cannot reflect deletions, and ``If-Modified-Since`` alone
+would then wrongly revalidate.
+
+Usage (inside ``login_required`` so anonymous users are redirected first)::
+
+    @login_required
+    @conditional_user_page
+    def budgets_view(request):
+        ...
+
+Note: ``QuerySet.update()`` does not touch ``auto_now`` fields; code that bulk
+updates these models must set ``updated_at=timezone.now()`` explicitly.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import Budget, Category, Profile, Transaction
+
+
+def user_data_state(user):
+    """Return ``(last_modified, counts)`` for everything the user's pages render."""
+    latest = None
+    counts = []
+    for model, owner_field in ((Profile, 'user'), (Category, 'owner'), (Budget, 'owner'), (Transaction, 'owner')):
+        row = model.objects.filter(**{owner_field: user}).aggregate(latest=Max('updated_at'), n=Count('pk'))
+        counts.append(row['n'])
+        if row['latest'] and (latest is None or row['latest'] > latest):
+            latest = row['latest']
+    return latest, tuple(counts)
+
+
+def _has_pending_messages(request):
+    # A flash message (e.g. a rejected form POST that redirected back) must be
+    # rendered even though no data changed, so never answer 304 while one is queued.
+    storage = getattr(request, '_messages', None)
+    return storage is not None and len(storage) > 0
+
+
+def user_page_etag(request, *args, **kwargs):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated or _has_pending_messages(request):
+        return None
+    latest, counts = user_data_state(user)
+    # The pages show "this month" figures, so the ETag also rolls over with the date.
+    release = getattr(settings, 'RELEASE_VERSION', '')
+    raw = (f"{release}:{user.pk}:{request.path}:{timezone.localdate()}:"
+           f"{latest and latest.isoformat()}:{counts}")
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def conditional_user_page(view_func):
+    """Serve 304 Not Modified for unchanged per-user pages and mark them private."""
+    conditional_view = condition(etag_func=user_page_etag)(view_func)
+
+    @wraps(view_func)
+    def _wrapped(request, *args, **kwargs):
+        # Form submissions never get a 304; skip the aggregates the ETag needs.
+        if request.method not in ('GET', 'HEAD'):
+            return view_func(request, *args, **kwargs)
+        response = conditional_view(request, *args, **kwargs)
+        # Browsers may keep the page but must revalidate it; shared caches must not store it.
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    return _wrapped
@@ -0,0 +1,20 @@
+from finance.batch import BatchJob, BatchJobCommand
+from finance.models import Budget
+
+
+class BudgetNotificationJob(BatchJob):
+    name = 'budget_notifications'
+
+    def get_users(self):
+        return super().get_users().filter(pk__in=Budget.objects.values('owner'))
+
+    def process_user(self, user):
+        from finance import check_and_notify_budget
+
+        for budget in Budget.objects.filter(owner=user).select_related('category'):
+            check_and_notify_budget(user, budget.category, budget.currency)
+
+
+class Command(BatchJobCommand):
+    help = "Check every user's budgets and send over-budget notifications."
+    job_class = BudgetNotificationJob
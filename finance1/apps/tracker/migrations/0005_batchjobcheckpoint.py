@@ -0,0 +1,29 @@
+# Generated migration: checkpoints for resumable batch jobs
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0004_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchJobCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(max_length=100)),
+                ('run_key', models.CharField(max_length=100)),
+                ('first_user_id', models.BigIntegerField()),
+                ('last_user_id', models.BigIntegerField()),
+                ('user_count', models.PositiveIntegerField(default=0)),
+                ('duration', models.FloatField(default=0)),
+                ('completed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['job', 'run_key'], name='finance_batch_job_run_idx')],
+            },
+        ),
+    ]
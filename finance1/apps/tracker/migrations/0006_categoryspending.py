@@ -0,0 +1,49 @@
+# Generated migration: maintained per-category spending ranking
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth, TruncYear
+
+
+def backfill_category_spending(apps, schema_editor):
+    Transaction = apps.get_model('finance', 'Transaction')
+    CategorySpending = apps.get_model('finance', 'CategorySpending')
+    rows = []
+    for period, trunc in (('month', TruncMonth), ('year', TruncYear)):
+        totals = (Transaction.objects.filter(transaction_type='expense')
+                  .annotate(period_start=trunc('date'))
+                  .values('owner_id', 'category_id', 'currency', 'period_start')
+                  .annotate(total=Sum('amount'))
+                  .order_by())
+        rows.extend(CategorySpending(period=period, **values) for values in totals)
+    CategorySpending.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0005_batchjobcheckpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorySpending',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('month', 'Month'), ('year', 'Year')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('currency', models.CharField(max_length=8)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='finance.category')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'period', 'period_start', 'currency', '-total'], name='finance_spending_rank_idx')],
+                'unique_together': {('owner', 'period', 'period_start', 'currency', 'category')},
+            },
+        ),
+        migrations.RunPython(backfill_category_spending, migrations.RunPython.noop),
+    ]
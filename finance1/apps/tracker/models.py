@@ -2,7 +2,10 @@
 Models for finance app.
 This file is separate to avoid AppRegistryNotReady errors during Django app initialization.
 """
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 from django.conf import settings
 from django.utils import timezone
 
@@ -11,6 +14,7 @@ class Profile(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     bio = models.TextField(blank=True)
     target_savings = models.DecimalField(max_digits=12, decimal_places=2, default=0, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Profile({self.user.username})"
@@ -22,6 +26,7 @@ class Category(models.Model):
     type = models.CharField(max_length=10, choices=TYPE_CHOICES)
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.name} ({self.type})"
@@ -32,6 +37,7 @@ class Budget(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     currency = models.CharField(max_length=8, default='USD')
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('owner', 'category', 'currency')
@@ -50,6 +56,129 @@ class Transaction(models.Model):
     transaction_type = models.CharField(max_length=10, choices=TYPE_CHOICES)
     currency = models.CharField(max_length=8, default='USD')
     receipt = models.FileField(upload_to='receipts/', blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def save(self, *args, **kwargs):
+        # The CategorySpending signal handlers run inside save(); keep the row
+        # write and the running-total adjustment in one database transaction.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.transaction_type} {self.amount} {self.currency}"
+
+
+class BatchJobCheckpoint(models.Model):
+    """A completed shard of a batch job run, used to resume an interrupted run."""
+    job = models.CharField(max_length=100)
+    run_key = models.CharField(max_length=100)
+    first_user_id = models.BigIntegerField()
+    last_user_id = models.BigIntegerField()
+    user_count = models.PositiveIntegerField(default=0)
+    duration = models.FloatField(default=0)
+    completed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['job', 'run_key'], name='finance_batch_job_run_idx')]
+
+    def __str__(self):
+        return f"{self.job}[{self.run_key}] users {self.first_user_id}-{self.last_user_id}"
+
+
+class CategorySpending(models.Model):
+    """Running expense total per (owner, period, currency, category).
+
+    Maintained incrementally by the Transaction signal handlers below so the
+    reports page can read a ranked top-N without aggregating raw transactions.
+    Writes that bypass signals (``bulk_create``, ``QuerySet.update``) must be
+    followed by ``finance.spending.rebuild_category_spending``.
+    """
+    PERIOD_CHOICES = (('month', 'Month'), ('year', 'Year'))
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    currency = models.CharField(max_length=8)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('owner', 'period', 'period_start', 'currency', 'category')
+        indexes = [
+            models.Index(fields=['owner', 'period', 'period_start', 'currency', '-total'], name='finance_spending_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner} {self.period} {self.period_start} {self.category}: {self.total} {self.currency}"
+
+
+def period_starts(day):
+    return (('month', day.replace(day=1)), ('year', day.replace(month=1, day=1)))
+
+
+def adjust_category_spending(owner_id, category_id, currency, day, delta):
+    if not delta:
+        return
+    for period, start in period_starts(day):
+        key = dict(owner_id=owner_id, period=period, period_start=start, currency=currency, category_id=category_id)
+        # Rows are kept at zero or below (refunds are negative expenses) so the
+        # running totals always match a recount of the raw transactions.
+        if not CategorySpending.objects.filter(**key).update(total=F('total') + delta):
+            try:
+                with transaction.atomic():
+                    CategorySpending.objects.create(total=delta, **key)
+            except IntegrityError:
+                # Another request created the row between our update and insert.
+                CategorySpending.objects.filter(**key).update(total=F('total') + delta)
+
+
+def _spending_entry(values):
+    """Return ``((owner_id, category_id, currency, day), amount)`` for an expense, else None."""
+    if values['transaction_type'] != 'expense':
+        return None
+    # Unsaved instances may still hold strings or the timezone.now default.
+    day = Transaction._meta.get_field('date').to_python(values['date'])
+    amount = Transaction._meta.get_field('amount').to_python(values['amount'])
+    return (values['owner_id'], values['category_id'], values['currency'], day), amount
+
+
+_SPENDING_FIELDS = ('owner_id', 'category_id', 'currency', 'date', 'amount', 'transaction_type')
+
+
+@receiver(pre_save, sender=Transaction)
+def _remember_previous_spending(sender, instance, raw=False, **kwargs):
+    instance._previous_spending = None
+    if instance.pk and not raw:
+        # Lock the stored row so a concurrent save cannot change it between this
+        # read and the post_save adjustment (Transaction.save is atomic).
+        previous = (Transaction.objects.select_for_update().filter(pk=instance.pk)
+                    .values(*_SPENDING_FIELDS).first())
+        if previous:
+            instance._previous_spending = _spending_entry(previous)
+
+
+@receiver(post_save, sender=Transaction)
+def _update_spending_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_previous_spending', None)
+    new = _spending_entry({field: getattr(instance, field) for field in _SPENDING_FIELDS})
+    if old and new and old[0] == new[0]:
+        if old[1] != new[1]:
+            adjust_category_spending(*new[0], new[1] - old[1])
+        return
+    if old:
+        adjust_category_spending(*old[0], -old[1])
+    if new:
+        adjust_category_spending(*new[0], new[1])
+
+
+@receiver(post_delete, sender=Transaction)
+def _update_spending_on_delete(sender, instance, origin=None, **kwargs):
+    # When the delete cascades from a user or category, their spending rows are
+    # removed by the same cascade; adjusting them would recreate orphans.
+    if origin is not None and not (isinstance(origin, Transaction)
+                                   or (isinstance(origin, QuerySet) and origin.model is Transaction)):
+        return
+    entry = _spending_entry({field: getattr(instance, field) for field in _SPENDING_FIELDS})
+    if entry:
+        adjust_category_spending(*entry[0], -entry[1])
@@ -0,0 +1,65 @@
+"""
+Read side of the per-category spending ranking kept in ``CategorySpending``.
+
+The rows are maintained on every Transaction write (see the signal handlers in
+``models``), so dashboards read at most one row per category, already ordered by
+the ``(owner, period, period_start, currency, -total)`` index and with the
+category joined in.
+"""
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth, TruncYear
+from django.utils import timezone
+
+from .models import CategorySpending, Transaction, period_starts
+
+
+def category_breakdown(owner, period='month', currency='USD', on=None, limit=None):
+    """Return ``[{'category', 'total', 'percent'}]`` ranked by spending for the period containing ``on``.
+
+    ``percent`` is relative to the owner's total expenses for that period and
+    currency, including categories beyond ``limit``.
+    """
+    start = dict(period_starts(on or timezone.localdate()))[period]
+    rows = (CategorySpending.objects
+            .filter(owner=owner, period=period, period_start=start, currency=currency, total__gt=0)
+            .select_related('category')
+            .order_by('-total', 'category__name'))
+    if limit is None:
+        rows = list(rows)
+        grand_total = sum(row.total for row in rows)
+    else:
+        grand_total = rows.aggregate(t=Sum('total'))['t'] or 0
+        rows = list(rows[:limit])
+    return [
+        {
+            'category': row.category,
+            'total': row.total,
+            'percent': round(row.total * 100 / grand_total, 1) if grand_total else 0,
+        }
+        for row in rows
+    ]
+
+
+def top_categories(owner, period='month', currency='USD', on=None, limit=5):
+    return category_breakdown(owner, period=period, currency=currency, on=on, limit=limit)
+
+
+def rebuild_category_spending(owner=None):
+    """Recompute ``CategorySpending`` from raw transactions (after bulk imports or for repair)."""
+    expenses = Transaction.objects.filter(transaction_type='expense')
+    stale = CategorySpending.objects.all()
+    if owner is not None:
+        expenses = expenses.filter(owner=owner)
+        stale = stale.filter(owner=owner)
+    rows = []
+    for period, trunc in (('month', TruncMonth), ('year', TruncYear)):
+        totals = (expenses.annotate(period_start=trunc('date'))
+                  .values('owner_id', 'category_id', 'currency', 'period_start')
+                  .annotate(total=Sum('amount'))
+                  .order_by())
+        rows.extend(CategorySpending(period=period, **values) for values in totals)
+    with transaction.atomic():
+        stale.delete()
+        CategorySpending.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
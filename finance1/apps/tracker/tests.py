@@ -1,8 +1,23 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory
+from django.http import HttpResponse
 from django.contrib.auth.models import User
 from finance.models import Category, Transaction, Budget, Profile
+from finance.caching import conditional_user_page
+from finance.api import BudgetBulkView, BudgetCopyView, bulk_upsert_budgets, copy_budgets
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.exceptions import ValidationError
+from finance.models import BatchJobCheckpoint, CategorySpending
+from finance.spending import category_breakdown, top_categories, rebuild_category_spending
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from finance.batch import BatchJob, plan_shards, run_batch_job
+import multiprocessing
+import unittest
+from io import StringIO
 from django.urls import reverse
 from decimal import Decimal
+from datetime import date
 import json
 from unittest.mock import patch, MagicMock
 
@@ -141,3 +156,320 @@ class FullSystemTests(TestCase):
         # But let's skip complex mocking of urlopen and just test logic if we can.
         # Check `finalize_signup` is enough for the new logic. 
         pass
+
+
+class ConditionalPageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cacheuser', password='password123')
+        self.category = Category.objects.create(name='Food', type='expense', owner=self.user)
+        self.factory = RequestFactory()
+        self.renders = 0
+
+        def page(request):
+            self.renders += 1
+            return HttpResponse('page')
+        self.view = conditional_user_page(page)
+
+    def get(self, **headers):
+        request = self.factory.get('/budgets/', headers=headers)
+        request.user = self.user
+        return self.view(request)
+
+    def test_unchanged_data_returns_304_without_rendering(self):
+        resp = self.get()
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('private', resp['Cache-Control'])
+
+        resp = self.get(if_none_match=resp['ETag'])
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(self.renders, 1)
+
+    def test_new_transaction_invalidates_etag(self):
+        etag = self.get()['ETag']
+        Transaction.objects.create(owner=self.user, amount=Decimal('10'), category=self.category,
+                                   transaction_type='expense', currency='USD')
+        resp = self.get(if_none_match=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+
+    def test_deletion_invalidates_and_no_last_modified(self):
+        resp = self.get()
+        self.assertFalse(resp.has_header('Last-Modified'))
+        self.category.delete()
+        self.assertEqual(self.get(if_none_match=resp['ETag']).status_code, 200)
+
+    def test_post_skips_etag_computation(self):
+        request = self.factory.post('/budgets/')
+        request.user = self.user
+        with patch('finance.caching.user_data_state') as mock_state:
+            resp = self.view(request)
+        mock_state.assert_not_called()
+        self.assertFalse(resp.has_header('ETag'))
+        self.assertEqual(self.renders, 1)
+
+    def test_new_release_invalidates_etag(self):
+        etag = self.get()['ETag']
+        with self.settings(RELEASE_VERSION='next-release'):
+            self.assertEqual(self.get(if_none_match=etag).status_code, 200)
+
+
+class BulkBudgetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulkuser', password='password123')
+        self.food = Category.objects.create(name='Food', type='expense', owner=self.user)
+
+    def test_bulk_upsert_creates_and_updates(self):
+        Budget.objects.create(owner=self.user, category=self.food, amount=Decimal('100'), currency='USD')
+        written = bulk_upsert_budgets(self.user, [
+            {'category_name': 'Food', 'amount': Decimal('250'), 'currency': 'USD'},
+            {'category_name': 'Rent', 'amount': Decimal('900'), 'currency': 'USD'},
+        ])
+        self.assertEqual(written, 2)
+        self.assertEqual(Budget.objects.get(category=self.food, currency='USD').amount, Decimal('250'))
+        self.assertEqual(Budget.objects.get(category__name='Rent').amount, Decimal('900'))
+        self.assertEqual(Budget.objects.filter(owner=self.user).count(), 2)
+
+    def test_copy_budgets_to_other_currency_scaled(self):
+        Budget.objects.create(owner=self.user, category=self.food, amount=Decimal('100'), currency='USD')
+        copy_budgets(self.user, 'USD', 'EUR', Decimal('110'))
+        self.assertEqual(Budget.objects.get(category=self.food, currency='EUR').amount, Decimal('110.00'))
+
+        # Copying again updates the existing row instead of violating the unique constraint
+        copy_budgets(self.user, 'USD', 'EUR', Decimal('50'))
+        self.assertEqual(Budget.objects.get(category=self.food, currency='EUR').amount, Decimal('50.00'))
+        self.assertEqual(Budget.objects.get(category=self.food, currency='USD').amount, Decimal('100'))
+
+    def test_income_and_inactive_category_names_are_rejected(self):
+        Category.objects.create(name='Salary', type='income', owner=self.user)
+        Category.objects.create(name='Travel', type='expense', owner=self.user, is_active=False)
+        for name in ('Salary', 'Travel'):
+            with self.assertRaises(ValidationError):
+                bulk_upsert_budgets(self.user, [{'category_name': name, 'amount': Decimal('10'), 'currency': 'USD'}])
+            self.assertEqual(Category.objects.filter(owner=self.user, name=name).count(), 1)
+        self.assertFalse(Budget.objects.exists())
+
+        resp = self.post(BudgetBulkView, [{'category_name': 'Salary', 'amount': '10'}], user=self.user)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_copy_skips_income_and_inactive_categories(self):
+        salary = Category.objects.create(name='Salary', type='income', owner=self.user)
+        old = Category.objects.create(name='Travel', type='expense', owner=self.user, is_active=False)
+        for category in (self.food, salary, old):
+            Budget.objects.create(owner=self.user, category=category, amount=Decimal('100'), currency='USD')
+        copy_budgets(self.user, 'USD', 'EUR')
+        self.assertEqual(list(Budget.objects.filter(currency='EUR').values_list('category', flat=True)), [self.food.pk])
+
+    def test_copy_keeps_fractional_results(self):
+        Budget.objects.create(owner=self.user, category=self.food, amount=Decimal('10'), currency='USD')
+        copy_budgets(self.user, 'USD', 'EUR', Decimal('33'))
+        self.assertEqual(Budget.objects.get(category=self.food, currency='EUR').amount, Decimal('3.30'))
+
+    def test_copy_rejects_overflowing_scale(self):
+        Budget.objects.create(owner=self.user, category=self.food, amount=Decimal('9999999999'), currency='USD')
+        with self.assertRaises(ValidationError):
+            copy_budgets(self.user, 'USD', 'EUR', Decimal('200'))
+        self.assertFalse(Budget.objects.filter(currency='EUR').exists())
+
+        resp = self.post(BudgetCopyView, {'source_currency': 'USD', 'target_currency': 'EUR', 'percent': '200'}, user=self.user)
+        self.assertEqual(resp.status_code, 400)
+        resp = self.post(BudgetCopyView, {'source_currency': 'USD', 'percent': '99999.99'}, user=self.user)
+        self.assertEqual(resp.status_code, 400)
+
+    def post(self, view, data, user=None):
+        request = APIRequestFactory().post('/api/budgets/', data, format='json')
+        if user:
+            force_authenticate(request, user=user)
+        return view.as_view()(request)
+
+    def test_bulk_view(self):
+        resp = self.post(BudgetBulkView, [{'category_name': 'Food', 'amount': '75'}], user=self.user)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data, {'written': 1})
+        self.assertEqual(Budget.objects.get(category=self.food, currency='USD').amount, Decimal('75'))
+
+    def test_bulk_view_rejects_invalid_input(self):
+        self.assertEqual(self.post(BudgetBulkView, {'category_name': 'Food', 'amount': '75'}, user=self.user).status_code, 400)
+        self.assertEqual(self.post(BudgetBulkView, [{'category_name': 'Food', 'amount': '-5'}], user=self.user).status_code, 400)
+        self.assertEqual(self.post(BudgetBulkView, [{'amount': '5'}], user=self.user).status_code, 400)
+        self.assertFalse(Budget.objects.exists())
+
+    def test_copy_view(self):
+        Budget.objects.create(owner=self.user, category=self.food, amount=Decimal('100'), currency='USD')
+        resp = self.post(BudgetCopyView, {'source_currency': 'USD', 'target_currency': 'EUR', 'percent': '90'}, user=self.user)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(Budget.objects.get(category=self.food, currency='EUR').amount, Decimal('90.00'))
+        self.assertEqual(self.post(BudgetCopyView, {'percent': '90'}, user=self.user).status_code, 400)
+
+    def test_views_require_authentication(self):
+        self.assertIn(self.post(BudgetBulkView, [{'category_name': 'Food', 'amount': '75'}]).status_code, (401, 403))
+        self.assertIn(self.post(BudgetCopyView, {'source_currency': 'USD'}).status_code, (401, 403))
+        self.assertFalse(Budget.objects.exists())
+
+
+class BudgetSweepTests(TestCase):
+    def setUp(self):
+        for name in ('alice', 'bob', 'carol'):
+            user = User.objects.create_user(username=name, password='password123')
+            category = Category.objects.create(name='Food', type='expense', owner=user)
+            Budget.objects.create(owner=user, category=category, amount=Decimal('100'), currency='USD')
+
+    @patch('finance.check_and_notify_budget')
+    def test_sweep_checks_every_budget_and_checkpoints_shards(self, mock_check):
+        call_command('budget_sweep', workers=1, chunk_size=2, run_key='nightly', stdout=StringIO())
+        self.assertEqual(mock_check.call_count, 3)
+        self.assertEqual(BatchJobCheckpoint.objects.filter(job='budget_notifications', run_key='nightly').count(), 2)
+
+    @patch('finance.check_and_notify_budget')
+    def test_rerun_resumes_from_checkpoints(self, mock_check):
+        call_command('budget_sweep', workers=1, chunk_size=2, run_key='nightly', stdout=StringIO())
+        mock_check.reset_mock()
+        call_command('budget_sweep', workers=1, chunk_size=2, run_key='nightly', stdout=StringIO())
+        mock_check.assert_not_called()
+
+        call_command('budget_sweep', workers=1, chunk_size=2, run_key='nightly', restart=True, stdout=StringIO())
+        self.assertEqual(mock_check.call_count, 3)
+
+    def test_rejects_non_positive_workers_and_chunk_size(self):
+        with self.assertRaises(CommandError):
+            call_command('budget_sweep', workers=0, stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('budget_sweep', chunk_size=0, stdout=StringIO())
+
+    def test_unnamed_job_is_rejected_before_running(self):
+        class UnnamedJob(BatchJob):
+            def process_user(self, user):
+                pass
+        with self.assertRaises(ValueError):
+            run_batch_job(UnnamedJob, 'r', workers=1)
+        self.assertFalse(BatchJobCheckpoint.objects.exists())
+
+    def test_plan_skips_users_inside_nested_checkpoints(self):
+        for name in ('dave', 'erin', 'frank', 'grace'):
+            User.objects.create_user(username=name, password='password123')
+        pks = list(User.objects.order_by('pk').values_list('pk', flat=True))
+        job = BatchJob()
+        job.name = 'merge_check'
+        # Run 1 (chunk 2) finished (1,2) and (5,6); a retry with a larger chunk finished (3,7).
+        for first, last in ((0, 1), (4, 5), (2, 6)):
+            BatchJobCheckpoint.objects.create(job='merge_check', run_key='r', first_user_id=pks[first], last_user_id=pks[last])
+        self.assertEqual(plan_shards(job, 'r', chunk_size=2), [])
+
+
+class ProfileMarkJob(BatchJob):
+    name = 'mark_profiles'
+
+    def process_user(self, user):
+        Profile.objects.update_or_create(user=user, defaults={'bio': 'swept'})
+
+
+class FailingProfileMarkJob(ProfileMarkJob):
+    name = 'mark_profiles_failing'
+
+    def process_user(self, user):
+        if user.username == 'bob':
+            raise RuntimeError('boom')
+        super().process_user(user)
+
+
+@unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), 'needs the fork start method')
+@unittest.skipIf(connection.vendor == 'sqlite' and connection.is_in_memory_db(), 'workers cannot share an in-memory database')
+class ParallelBatchJobTests(TransactionTestCase):
+    def setUp(self):
+        for name in ('alice', 'bob', 'carol', 'dave', 'erin'):
+            User.objects.create_user(username=name, password='password123')
+
+    def run_job(self, job_class):
+        # fork keeps the test database settings in the workers
+        return run_batch_job(job_class, 'parallel', chunk_size=2, workers=2, mp_context=multiprocessing.get_context('fork'))
+
+    def test_workers_process_every_shard_and_parent_checkpoints(self):
+        results, errors = self.run_job(ProfileMarkJob)
+        self.assertEqual(errors, [])
+        self.assertEqual(sum(r['user_count'] for r in results), 5)
+        self.assertEqual(Profile.objects.filter(bio='swept').count(), 5)
+        self.assertEqual(BatchJobCheckpoint.objects.filter(job='mark_profiles').count(), 3)
+
+    def test_failed_shard_is_reported_and_not_checkpointed(self):
+        results, errors = self.run_job(FailingProfileMarkJob)
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0][2], RuntimeError)
+        bob = User.objects.get(username='bob')
+        checkpoints = BatchJobCheckpoint.objects.filter(job='mark_profiles_failing')
+        self.assertEqual(checkpoints.count(), 2)
+        self.assertFalse(checkpoints.filter(first_user_id__lte=bob.pk, last_user_id__gte=bob.pk).exists())
+
+
+class CategorySpendingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='rankuser', password='password123')
+        self.food = Category.objects.create(name='Food', type='expense', owner=self.user)
+        self.rent = Category.objects.create(name='Rent', type='expense', owner=self.user)
+        self.salary = Category.objects.create(name='Salary', type='income', owner=self.user)
+        self.day = date(2025, 3, 10)
+
+    def add(self, category, amount, transaction_type='expense', **kwargs):
+        return Transaction.objects.create(owner=self.user, category=category, amount=Decimal(amount),
+                                          transaction_type=transaction_type, currency='USD',
+                                          date=kwargs.pop('date', self.day), **kwargs)
+
+    def test_ranking_follows_transaction_writes(self):
+        self.add(self.food, '100')
+        self.add(self.food, '50')
+        rent = self.add(self.rent, '900')
+        self.add(self.salary, '5000', transaction_type='income')
+
+        top = top_categories(self.user, 'month', 'USD', on=self.day)
+        self.assertEqual([row['category'].name for row in top], ['Rent', 'Food'])
+        self.assertEqual(top[1]['total'], Decimal('150'))
+        self.assertEqual(top[0]['percent'], Decimal('85.7'))
+
+        rent.amount = Decimal('100')
+        rent.save()
+        self.assertEqual(top_categories(self.user, 'month', 'USD', on=self.day, limit=1)[0]['category'], self.food)
+
+        rent.delete()
+        self.assertEqual(len(category_breakdown(self.user, 'year', 'USD', on=self.day)), 1)
+
+    def test_rebuild_matches_incremental_totals(self):
+        self.add(self.food, '20')
+        self.add(self.food, '30', date=date(2025, 4, 1))
+        expected = set(CategorySpending.objects.values_list('period', 'period_start', 'category_id', 'total'))
+        rebuild_category_spending(self.user)
+        self.assertEqual(set(CategorySpending.objects.values_list('period', 'period_start', 'category_id', 'total')), expected)
+
+    def test_failed_adjustment_rolls_back_the_transaction_write(self):
+        food = self.add(self.food, '20')
+        with patch('finance.models.adjust_category_spending', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.add(self.rent, '30')
+            food.amount = Decimal('99')
+            with self.assertRaises(RuntimeError):
+                food.save()
+        self.assertFalse(Transaction.objects.filter(category=self.rent).exists())
+        food.refresh_from_db()
+        self.assertEqual(food.amount, Decimal('20'))
+        incremental = self.spending_rows()
+        rebuild_category_spending(self.user)
+        self.assertEqual(incremental, self.spending_rows())
+
+    def spending_rows(self):
+        return set(CategorySpending.objects.values_list('period', 'period_start', 'category_id', 'total'))
+
+    def test_refunds_keep_totals_in_step_with_rebuild(self):
+        self.add(self.food, '50')
+        refund = self.add(self.food, '-60')
+        self.assertEqual(CategorySpending.objects.get(period='month', category=self.food).total, Decimal('-10'))
+
+        refund.delete()
+        incremental = self.spending_rows()
+        rebuild_category_spending(self.user)
+        self.assertEqual(incremental, self.spending_rows())
+        self.assertEqual(CategorySpending.objects.get(period='month', category=self.food).total, Decimal('50'))
+
+        # A net-zero category keeps its row and still matches a recount.
+        self.add(self.rent, '40')
+        self.add(self.rent, '-40')
+        incremental = self.spending_rows()
+        rebuild_category_spending(self.user)
+        self.assertEqual(incremental, self.spending_rows())
+        self.assertEqual([row['category'] for row in top_categories(self.user, 'month', 'USD', on=self.day)], [self.food])
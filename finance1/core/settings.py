@@ -24,6 +24,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Compresses the dynamic HTML; WhiteNoise already serves pre-compressed static files
+    'django.middleware.gzip.GZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -68,6 +70,11 @@ elif DEBUG:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # File-backed test database so multi-process batch job tests can share it
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+            # Batch job workers write concurrently: take the write lock when a
+            # transaction begins and wait for it instead of failing with "database is locked".
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
         }
     }
 else:
@@ -115,6 +122,9 @@ REST_FRAMEWORK = {
 # Logging minimal
 LOGGING = DEFAULT_LOGGING
 
+# Release identifier salted into the per-user page ETags so a deploy invalidates cached HTML
+RELEASE_VERSION = os.environ.get('RELEASE_VERSION') or os.environ.get('HEROKU_SLUG_COMMIT', '')
+
 # OAuth settings for Google: set these environment variables in production
 GOOGLE_OAUTH_CLIENT_ID = os.environ.get('GOOGLE_OAUTH_CLIENT_ID', '')
 GOOGLE_OAUTH_CLIENT_SECRET = os.environ.get('GOOGLE_OAUTH_CLIENT_SECRET', '')